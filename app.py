@@ -1,8 +1,13 @@
 import pickle
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
 import gdown
+import diskcache
 from dotenv import load_dotenv
 
 # -------------------------------
@@ -23,41 +28,177 @@ if not TMDB_API_KEY:
 # File Config
 # -------------------------------
 MOVIE_LIST_PATH = "movie_list.pkl"
+# movie_id/title(/poster_path/poster_url) as plain arrays; loading it needs no pandas
+MOVIES_NPZ_PATH = "movies.npz"
+# Shipped with the code (not downloaded), so resolve it next to this script
+STYLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "style.css")
+# On-disk (etag, poster_url) per movie_id, for conditional TMDB requests across restarts
+ETAG_CACHE_PATH = ".tmdb_etag"
 SIMILARITY_PATH = "similarity.pkl"
+# Raw .npy copy of the (uint8) matrix from the notebook, memory-mapped while building neighbors
+SIMILARITY_NPY_PATH = "similarity.npy"
+# Compressed archive of the same matrix; much smaller to download than the pickle
+SIMILARITY_NPZ_PATH = "similarity.npz"
+# Top-K most similar movies per row (int32); the only similarity data used at runtime
+NEIGHBORS_PATH = "neighbors.npy"
+NEIGHBOR_COUNT = 50
 
 # Direct Google Drive links (converted from your shared links)
-MOVIE_LIST_URL = "https://drive.google.com/uc?id=1aCq5M2VGk4nV3l41U-8nOtyitnUVv9He"
+# MOVIE_LIST_URL can be overridden so the movie list matches a hosted neighbors.npy
+MOVIE_LIST_URL = os.getenv("MOVIE_LIST_URL") or "https://drive.google.com/uc?id=1aCq5M2VGk4nV3l41U-8nOtyitnUVv9He"
 SIMILARITY_URL = "https://drive.google.com/uc?id=1iGnGesL-2wSPB4bQstgYoVR944-aZiUS"
+# Optional link to similarity.npz (from the notebook); preferred over the pickle when set
+SIMILARITY_NPZ_URL = os.getenv("SIMILARITY_NPZ_URL")
+# Optional link to neighbors.npy (from the notebook); skips the similarity download entirely
+NEIGHBORS_URL = os.getenv("NEIGHBORS_URL")
+
+# Movies shown per recommendation, picked from the nearest candidates that have posters
+NUM_RECOMMENDATIONS = 9
+NUM_CANDIDATES = 29
+
+# Poster lookups are I/O-bound, so fetch them concurrently
+POSTER_FETCH_WORKERS = 8
+
+TMDB_MOVIE_URL = "https://api.themoviedb.org/3/movie/{movie_id}?api_key=" + TMDB_API_KEY + "&language=en-US"
+# w342 is plenty for a 3-column grid and much lighter than w500
+POSTER_BASE_URL = "https://image.tmdb.org/t/p/w342"
+
+# -------------------------------
+# Shared HTTP session (keep-alive + retries, cached)
+# -------------------------------
+@st.cache_resource
+def get_session():
+    """Create one pooled session per process, shared across reruns and users"""
+    session = requests.Session()
+    session.mount(
+        "https://",
+        HTTPAdapter(
+            pool_connections=16,
+            pool_maxsize=16,
+            max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=[429, 500, 502, 503, 504]),
+        ),
+    )
+    return session
+
+
+@st.cache_resource
+def get_etag_cache():
+    """Open the on-disk ETag store once per process"""
+    return diskcache.Cache(ETAG_CACHE_PATH)
 
 # -------------------------------
 # Ensure required data files exist
 # -------------------------------
 def download_data():
-    """Download .pkl files if they don't exist"""
+    """Download data files if they don't exist"""
     os.makedirs(".", exist_ok=True)
 
-    if not os.path.exists(MOVIE_LIST_PATH):
-        with st.spinner("📦 Downloading movie_list.pkl (first time only)..."):
-            gdown.download(MOVIE_LIST_URL, MOVIE_LIST_PATH, quiet=False)
-        st.success("✅ movie_list.pkl downloaded!")
+    # (url, path) for every file still missing
+    needed = []
+
+    if not os.path.exists(MOVIES_NPZ_PATH) and not os.path.exists(MOVIE_LIST_PATH):
+        needed.append((MOVIE_LIST_URL, MOVIE_LIST_PATH))
+
+    if not os.path.exists(NEIGHBORS_PATH):
+        if NEIGHBORS_URL:
+            needed.append((NEIGHBORS_URL, NEIGHBORS_PATH))
+        elif not has_similarity_source():
+            if SIMILARITY_NPZ_URL:
+                needed.append((SIMILARITY_NPZ_URL, SIMILARITY_NPZ_PATH))
+            else:
+                needed.append((SIMILARITY_URL, SIMILARITY_PATH))
 
-    if not os.path.exists(SIMILARITY_PATH):
-        with st.spinner("📦 Downloading similarity.pkl (first time only)..."):
-            gdown.download(SIMILARITY_URL, SIMILARITY_PATH, quiet=False)
-        st.success("✅ similarity.pkl downloaded!")
+    if not needed:
+        return
+
+    # Stream all missing files in parallel so first start waits for the slowest, not the sum
+    names = ", ".join(path for _, path in needed)
+    with st.spinner(f"📦 Downloading {names} (first time only)..."):
+        with ThreadPoolExecutor(max_workers=len(needed)) as executor:
+            futures = [executor.submit(gdown.download, url, path, quiet=False) for url, path in needed]
+            for future in futures:
+                future.result()
+    st.success(f"✅ {names} downloaded!")
 
 # -------------------------------
-# Data Loader (cached)
+# Generated files
 # -------------------------------
-@st.cache_resource
-def load_data():
-    """Load pickled data safely with caching"""
-    download_data()
+def save_atomically(path, writer):
+    """Write via a temp file so an interrupted run never leaves a truncated file behind"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        writer(f)
+    os.replace(tmp_path, path)
+
+# -------------------------------
+# Precompute the top-K neighbor table (first run only)
+# -------------------------------
+def has_similarity_source():
+    return any(os.path.exists(p) for p in (SIMILARITY_NPY_PATH, SIMILARITY_NPZ_PATH, SIMILARITY_PATH))
+
+
+def neighbors_match(neighbors, n_movies):
+    """Check the neighbor table was built for a movie table of this size"""
+    return neighbors.shape[0] == n_movies and (neighbors.size == 0 or neighbors.max() < n_movies)
+
+
+def load_similarity():
+    """Load the full similarity matrix from whichever copy is available"""
+    if os.path.exists(SIMILARITY_NPY_PATH):
+        return np.load(SIMILARITY_NPY_PATH, mmap_mode="r")
+    if os.path.exists(SIMILARITY_NPZ_PATH):
+        with np.load(SIMILARITY_NPZ_PATH) as archive:
+            return archive["similarity"]
+    with open(SIMILARITY_PATH, "rb") as f:
+        return np.asarray(pickle.load(f))
+
+
+def prepare_neighbors():
+    """Write neighbors.npy (most similar movies per row, best first) once"""
+    if os.path.exists(NEIGHBORS_PATH):
+        return
+
+    similarity_data = load_similarity()
+    n = len(similarity_data)
+    k = min(NEIGHBOR_COUNT, n - 1)
+    neighbors = np.empty((n, k), dtype=np.int32)
+
+    # Rank in row blocks to bound memory; O(N) selection per row, then sort only the top K
+    for start in range(0, n, 1024):
+        # np.array always copies, so the diagonal write below never touches the source (or a read-only mmap)
+        block = np.array(similarity_data[start:start + 1024], dtype=np.float32)
+        rows = np.arange(len(block))
+        block[rows, start + rows] = -np.inf  # never recommend a movie to itself
+        top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(block, top, axis=1), axis=1, kind="stable")
+        neighbors[start:start + len(block)] = np.take_along_axis(top, order, axis=1)
+
+    save_atomically(NEIGHBORS_PATH, lambda f: np.save(f, neighbors))
+
+# -------------------------------
+# Convert movie_list.pkl to plain NumPy columns (first run only)
+# -------------------------------
+def movie_list_stamp():
+    """(size, mtime) of movie_list.pkl, stored in movies.npz to detect a replaced pickle"""
+    stat = os.stat(MOVIE_LIST_PATH)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def prepare_movies():
+    """Write movies.npz from movie_list.pkl so later starts never import pandas"""
+    if os.path.exists(MOVIES_NPZ_PATH):
+        # Without the pickle (movies.npz shipped on its own) there is nothing to rebuild from
+        if not os.path.exists(MOVIE_LIST_PATH):
+            return
+        with np.load(MOVIES_NPZ_PATH) as archive:
+            stamp = archive["source_stamp"].tolist() if "source_stamp" in archive.files else None
+        if stamp == movie_list_stamp():
+            return
+
     import pandas as pd
 
-    # Load pickles
-    movies_data = pickle.load(open(MOVIE_LIST_PATH, "rb"))
-    similarity_data = pickle.load(open(SIMILARITY_PATH, "rb"))
+    with open(MOVIE_LIST_PATH, "rb") as f:
+        movies_data = pickle.load(f)
 
     # --- Handle different formats ---
     if isinstance(movies_data, tuple) or isinstance(movies_data, list):
@@ -81,95 +222,176 @@ def load_data():
     else:
         st.error("❌ Unexpected format for movie_list.pkl.")
         st.stop()
-    return movies_data, similarity_data
+
+    # Only the columns the app reads; fixed-width strings load without pickle,
+    # and TMDB ids (< 10 million) fit comfortably in int32
+    columns = {
+        "movie_id": movies_data["movie_id"].to_numpy(dtype=np.int32),
+        "title": movies_data["title"].to_numpy(dtype=str),
+        "source_stamp": np.array(movie_list_stamp(), dtype=np.int64),
+    }
+    for column in ("poster_path", "poster_url"):
+        if column in movies_data.columns:
+            columns[column] = movies_data[column].fillna("").to_numpy(dtype=str)
+
+    save_atomically(MOVIES_NPZ_PATH, lambda f: np.savez(f, **columns))
+
+# -------------------------------
+# Data Loader (cached)
+# -------------------------------
+@st.cache_resource
+def load_data():
+    """Load movie columns and the neighbor table with caching"""
+    download_data()
+    prepare_movies()
+    prepare_neighbors()
+
+    # Plain NumPy columns keep per-row lookups out of pandas' indexers
+    with np.load(MOVIES_NPZ_PATH) as archive:
+        movies = {name: archive[name] for name in archive.files if name != "source_stamp"}
+    neighbors = np.load(NEIGHBORS_PATH)
+
+    # A stale table (e.g. movie list replaced later) would point at the wrong rows;
+    # rebuild it from the similarity matrix when one is available
+    n_movies = len(movies["title"])
+    if not neighbors_match(neighbors, n_movies) and has_similarity_source():
+        os.remove(NEIGHBORS_PATH)
+        prepare_neighbors()
+        neighbors = np.load(NEIGHBORS_PATH)
+    if not neighbors_match(neighbors, n_movies):
+        st.error("❌ neighbors.npy does not match the movie list; regenerate both from the same notebook run.")
+        st.stop()
+
+    # Map each title to its row position once (first occurrence wins)
+    idx_map = {}
+    for i, title in enumerate(movies["title"].tolist()):
+        idx_map.setdefault(title, i)
+
+    return movies, neighbors, idx_map
 
 
 
 # -------------------------------
 # Function to fetch movie poster
 # -------------------------------
+def build_poster_url(poster_path):
+    if isinstance(poster_path, str) and poster_path:
+        return f"{POSTER_BASE_URL}/{poster_path.lstrip('/')}"
+    return None
+
+# Raises on any failure, so only successful lookups are cached
+@st.cache_data(ttl=60 * 60 * 24, max_entries=5000, show_spinner=False)
+def lookup_poster(movie_id):
+    url = TMDB_MOVIE_URL.format(movie_id=movie_id)
+    etag_cache = get_etag_cache()
+    cached = etag_cache.get(movie_id)
+
+    # Let TMDB answer 304 Not Modified when the stored ETag is still current
+    headers = {"If-None-Match": cached[0]} if cached else {}
+    response = get_session().get(url, headers=headers, timeout=5)
+    if response.status_code == 304 and cached:
+        return cached[1]
+    response.raise_for_status()
+    data = response.json()
+    poster_url = build_poster_url(data.get("poster_path"))
+    etag = response.headers.get("ETag")
+    if etag:
+        etag_cache.set(movie_id, (etag, poster_url))
+    return poster_url
+
+
 def fetch_poster(movie_id):
-    url = f"https://api.themoviedb.org/3/movie/{movie_id}?api_key={TMDB_API_KEY}&language=en-US"
     try:
-        response = requests.get(url, timeout=5)
-        response.raise_for_status()
-        data = response.json()
-        poster_path = data.get("poster_path")
-        if poster_path:
-            return f"https://image.tmdb.org/t/p/w500/{poster_path}"
+        return lookup_poster(movie_id)
     except Exception:
-        return None
-    return None
+        # Not cached, so the next rerun retries; meanwhile serve the last known URL if any
+        cached = get_etag_cache().get(movie_id)
+        return cached[1] if cached else None
+
+def fill_missing_posters(posters, candidates, movie_ids, limit=None):
+    """Fetch posters from TMDB (concurrently) for the candidates that have none yet.
+
+    With a limit, only the missing entries ahead of the limit-th available poster
+    are fetched, in batches, so prefetched datasets skip lookups that would be cut off.
+    """
+    tried = set()
+    with ThreadPoolExecutor(max_workers=POSTER_FETCH_WORKERS) as executor:
+        while True:
+            batch = []
+            available = 0
+            for k, poster_url in enumerate(posters):
+                if poster_url:
+                    available += 1
+                elif k not in tried:
+                    batch.append(k)
+                if limit is not None and available + len(batch) >= limit:
+                    break
+            if not batch:
+                return
+            tried.update(batch)
+            fetched = executor.map(fetch_poster, [int(movie_ids[candidates[k]]) for k in batch])
+            for k, poster_url in zip(batch, fetched):
+                posters[k] = poster_url
 
 # -------------------------------
 # Recommendation Function
 # -------------------------------
-def recommend(movie, movies, similarity):
+def recommend(movie, movies, neighbors, idx_map):
     try:
-        index = movies[movies["title"] == movie].index[0]
-    except IndexError:
+        index = idx_map[movie]
+    except KeyError:
         st.error("❌ Selected movie not found in dataset.")
         return [], []
 
-    distances = sorted(
-        list(enumerate(similarity[index])),
-        reverse=True,
-        key=lambda x: x[1]
-    )
+    # Ranking is a precomputed slice; posters are cached per movie by lookup_poster()
+    candidates = neighbors[index][:NUM_CANDIDATES]
+
+    titles = movies["title"]
+    # Stored posters first; empty ones are looked up on TMDB below
+    limit = NUM_RECOMMENDATIONS
+    if "poster_url" in movies:
+        # Full CDN URLs were precomputed when the dataset was built
+        poster_urls = movies["poster_url"]
+        posters = [poster_urls[i] or None for i in candidates]
+    elif "poster_path" in movies:
+        # Poster paths were prefetched into movie_list.pkl
+        poster_paths = movies["poster_path"]
+        posters = [build_poster_url(poster_paths[i]) for i in candidates]
+    else:
+        # Nothing stored: fetch every candidate in one concurrent round
+        posters = [None] * len(candidates)
+        limit = None
+    fill_missing_posters(posters, candidates, movies["movie_id"], limit=limit)
 
     recommended_movie_names = []
     recommended_movie_posters = []
 
-    for i in distances[1:30]:
-        movie_id = movies.iloc[i[0]].movie_id
-        poster_url = fetch_poster(movie_id)
+    for idx, poster_url in zip(candidates, posters):
         if poster_url:
             recommended_movie_posters.append(poster_url)
-            recommended_movie_names.append(movies.iloc[i[0]].title)
-        if len(recommended_movie_names) >= 9:
+            recommended_movie_names.append(titles[idx])
+        if len(recommended_movie_names) >= NUM_RECOMMENDATIONS:
             break
 
     return recommended_movie_names, recommended_movie_posters
 
 
+# -------------------------------
+# Stylesheet (read once, cached)
+# -------------------------------
+@st.cache_data
+def load_css():
+    with open(STYLE_PATH) as f:
+        return f.read()
+
+
 # -------------------------------
 # Streamlit UI Config
 # -------------------------------
 st.set_page_config(page_title="Movie Recommender 🎬", layout="wide")
 
 # Custom Styling
-st.markdown(
-    """
-    <style>
-    body {
-        background-color: #0d0d0d;
-        color: #ffffff;
-    }
-    .main {
-        background-color: #111111;
-        padding: 20px;
-        border-radius: 12px;
-    }
-    h1 {
-        text-align: center;
-        color: #ffcc00;
-        font-family: 'Trebuchet MS', sans-serif;
-    }
-    .stSelectbox label {
-        font-size: 18px;
-        font-weight: bold;
-        color: #ffcc00;
-    }
-    .movie-title {
-        text-align: center;
-        font-size: 16px;
-        font-weight: 600;
-        color: #ffffff;
-    }
-    </style>
-    """,
-    unsafe_allow_html=True,
-)
+st.markdown(f"<style>{load_css()}</style>", unsafe_allow_html=True)
 
 # -------------------------------
 # Header
@@ -179,16 +401,16 @@ st.markdown("<h1>🎬 Movie Recommender System</h1>", unsafe_allow_html=True)
 # -------------------------------
 # Load Data
 # -------------------------------
-movies, similarity = load_data()
+movies, neighbors, idx_map = load_data()
 
 # -------------------------------
 # Dropdown & Recommendation UI
 # -------------------------------
-movie_list = movies["title"].values
+movie_list = movies["title"]
 selected_movie = st.selectbox("🎥 Select a Movie:", movie_list)
 
 if st.button("🔍 Show Recommendation"):
-    recommended_movie_names, recommended_movie_posters = recommend(selected_movie, movies, similarity)
+    recommended_movie_names, recommended_movie_posters = recommend(selected_movie, movies, neighbors, idx_map)
 
     st.markdown("## 🍿 Recommended Movies for You")
     st.write("---")